@@ -0,0 +1,50 @@
+"""
+Compare peak memory of fetch_columns against cursor.fetchall()
+
+>>> python bench_fetch.py [n_rows]
+"""
+
+import sqlite3
+import sys
+import tracemalloc
+
+from querpy import Query, fetch_columns
+
+
+def build(n_rows):
+    conn = sqlite3.connect(':memory:')
+    conn.execute('CREATE TABLE tbl (id, qty, price)')
+    conn.executemany('INSERT INTO tbl VALUES (?, ?, ?)',
+                     ((i, i % 97, i * 0.25) for i in range(n_rows)))
+    query = Query()
+    query.s += ['id', 'qty', 'price']
+    query.f += 'tbl'
+    return conn, query
+
+
+def peak(fetch):
+    tracemalloc.start()
+    result = fetch()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak, result
+
+
+if __name__ == '__main__':
+    n_rows = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    conn, query = build(n_rows)
+
+    rows_peak, rows = peak(
+        lambda: conn.execute(query.statement).fetchall()
+    )
+    del rows
+    cols_peak, cols = peak(
+        lambda: fetch_columns(conn.execute(query.statement), query)
+    )
+
+    print('rows: {0}'.format(n_rows))
+    print('fetchall peak:      {0:>12,} bytes'.format(rows_peak))
+    print('fetch_columns peak: {0:>12,} bytes'.format(cols_peak))
+    print('ratio:              {0:>12.2f}x'.format(
+        float(rows_peak) / cols_peak
+    ))
@@ -18,7 +18,29 @@ __version__ = '0.1'
 __date__ = '2015-03-19'
 
 
+import copy
 import re
+from array import array
+from collections import OrderedDict
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+try:
+    array('q')
+    _int_typecode = 'q'
+except ValueError:  # no long long arrays on Python 2
+    _int_typecode = 'l'
+
+try:
+    _int_types = (int, long, bool)
+except NameError:  # Python 3
+    _int_types = (int, bool)
+
+
+_aggregate = re.compile('\\b(COUNT|SUM|AVG|MIN|MAX)\\s*\\(', flags=re.I)
 
 
 class Query(object):
@@ -264,6 +286,89 @@ class WhereComponent(QueryComponent):
     __repr__ = __str__
 
 
+class StatementCache(object):
+    """
+    LRU of prepared statements for a single connection, keyed by rendered
+    statement text; prepare(connection, statement) returns the handle to
+    execute on and defaults to a fresh DB-API cursor, which drivers may
+    reuse the prepared plan of when given the same statement again;
+    evicted handles stay open, as a caller may still be fetching from
+    them, and are passed to on_evict(handle) if given or else kept in
+    evicted until clear() closes them
+    """
+
+    def __init__(self, connection, size=100, prepare=None, on_evict=None):
+        if type(size) != int or size < 1:
+            raise ValueError('size must be a positive integer.')
+        self.connection = connection
+        self.size = size
+        self.prepare = prepare or (lambda conn, statement: conn.cursor())
+        self.on_evict = on_evict
+        self.cache = OrderedDict()
+        self.evicted = list()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, statement):
+        if isinstance(statement, Query):
+            statement = statement.statement
+        if statement in self.cache:
+            self.hits += 1
+            handle = self.cache.pop(statement)
+        else:
+            handle = self.prepare(self.connection, statement)
+            self.misses += 1
+            if len(self.cache) >= self.size:
+                self.evictions += 1
+                evicted = self.cache.popitem(last=False)[1]
+                if self.on_evict is not None:
+                    self.on_evict(evicted)
+                else:
+                    self.evicted.append(evicted)
+        self.cache[statement] = handle
+        return handle
+
+    def execute(self, query, params=()):
+        """
+        execute query (a Query or statement string) on its cached handle
+        and return the handle; results of an earlier execution of the same
+        statement are discarded, so fetch them first (a handle evicted by
+        later statements stays open and keeps its results)
+        """
+        statement = query.statement if isinstance(query, Query) else query
+        handle = self.get(statement)
+        handle.execute(statement, params)
+        return handle
+
+    def clear(self):
+        """
+        close and drop every cached and evicted handle, including any a
+        caller still holds from execute
+        """
+        for handle in list(self.cache.values()) + self.evicted:
+            self._close(handle)
+        self.cache = OrderedDict()
+        self.evicted = list()
+
+    @staticmethod
+    def _close(handle):
+        close = getattr(handle, 'close', None)
+        if close is not None:
+            close()
+
+    def __len__(self):
+        return len(self.cache)
+
+    def __str__(self):
+        return 'size: {0}/{1}, hits: {2}, misses: {3}, evictions: {4}'.format(
+            len(self.cache), self.size, self.hits, self.misses,
+            self.evictions
+        )
+
+    __repr__ = __str__
+
+
 
 def build_join(*args):
     tbl_name = args[0]
@@ -288,4 +393,302 @@ def replace_and(match):
     string = match.group(0)
     raw_newlines = re.subn('AND', '\n      AND', string)[0]
     out = re.subn('(?<=BETWEEN)( \w+? )\n\s*?(AND)', r'\1\2', raw_newlines)[0]
-    return out
\ No newline at end of file
+    return out
+
+
+def split_query(query, max_bytes=None, max_params=None, key=None,
+                param_marker='?', params=None):
+    """
+    split query into the fewest equivalent statements that each fit within
+    max_bytes (utf-8 length of the statement) and max_params (occurrences
+    of param_marker); the WHERE clause is split on its OR-chain first (the
+    results are to be unioned, so the query must be DISTINCT or select the
+    unique key), then the SELECT list into partial selects that each carry
+    the key columns (the results are joined on key); if params are given,
+    (part, part_params) pairs are returned with the values each part binds
+    """
+    if max_bytes is None and max_params is None:
+        raise ValueError('max_bytes or max_params must be given.')
+    if type(key) == str:
+        key = [key]
+
+    def fits(q):
+        statement = q.statement
+        if max_bytes is not None and \
+                len(statement.encode('utf-8')) > max_bytes:
+            return False
+        if max_params is not None and \
+                statement.count(param_marker) > max_params:
+            return False
+        return True
+
+    # positions in params of the markers in each component, in the order
+    # Query.statement renders them
+    offsets = dict()
+    n_params = 0
+    for name in ['s', 'f', 'j', 'w', 'g']:
+        offsets[name] = list()
+        for c in getattr(query, name).components:
+            count = c.count(param_marker)
+            offsets[name].append(list(range(n_params, n_params + count)))
+            n_params += count
+    if params is not None and len(params) != n_params:
+        raise ValueError('Query has {0} parameters but {1} given.'.format(
+            n_params, len(params)
+        ))
+
+    def result(parts):
+        if params is None:
+            return [part for part, positions in parts]
+        return [(part, tuple(params[i] for i in positions))
+                for part, positions in parts]
+
+    def positions(s=None, w=None):
+        s = range(len(query.s.components)) if s is None else s
+        w = range(len(query.w.components)) if w is None else w
+        out = list()
+        for name, indexes in [('s', s), ('f', None), ('j', None), ('w', w),
+                              ('g', None)]:
+            if indexes is None:
+                indexes = range(len(offsets[name]))
+            for i in indexes:
+                out.extend(offsets[name][i])
+        return out
+
+    if fits(query):
+        return result([(copy.deepcopy(query), positions())])
+    if query.top:
+        raise ValueError('A TOP query cannot be split.')
+    if not query.g.components and \
+            any(_aggregate.search(c) for c in query.s.components):
+        raise ValueError(
+            'A query with aggregates and no GROUP BY cannot be split.'
+        )
+
+    groups = _disjuncts(query.w)
+    unique = query.distinct or \
+        bool(key) and all(k in query.s.components for k in key)
+    if len(groups) > 1 and unique and not query.g.components:
+        def with_where(chunk):
+            part = copy.deepcopy(query)
+            part.w.components = [query.w.components[i] for i in chunk]
+            # lead with AND so Query.clean_up strips only this prefix
+            part.w.components[0] = re.sub(
+                '^OR ', 'AND ', part.w.components[0]
+            )
+            return part
+        chunks = _pack(groups, with_where, fits)
+        if chunks is not None:
+            return result([(with_where(chunk), positions(w=chunk))
+                           for chunk in chunks])
+
+    if key:
+        selected = query.s.components
+        key_indexes = [selected.index(k) for k in key if k in selected]
+        columns = [[i] for i, c in enumerate(selected) if c not in key]
+
+        def with_select(chunk):
+            part = copy.deepcopy(query)
+            part.s.components = key + [selected[i] for i in chunk]
+            return part
+        chunks = _pack(columns, with_select, fits)
+        if chunks is not None:
+            return result([(with_select(chunk),
+                            positions(s=key_indexes + chunk))
+                           for chunk in chunks])
+
+    raise ValueError('Query cannot be split to fit within the given limits.')
+
+
+def combine_results(query, parts, results, key=None):
+    """
+    recombine the rows fetched for each of the parts (or (part, params)
+    pairs) returned by split_query(query, ...); a single part is returned
+    as is, parts split on the WHERE clause are unioned and parts split on
+    the SELECT list are joined on key and returned in query's column order
+    """
+    if len(parts) != len(results):
+        raise ValueError('parts and results must be the same length.')
+    parts = [p[0] if type(p) == tuple else p for p in parts]
+
+    # an unsplit query need not be DISTINCT, so keep its duplicate rows
+    if len(parts) == 1:
+        return [tuple(row) for row in results[0]]
+
+    if all(p.s.components == query.s.components for p in parts):
+        seen = set()
+        combined = list()
+        for rows in results:
+            for row in rows:
+                row = tuple(row)
+                if row not in seen:
+                    seen.add(row)
+                    combined.append(row)
+        return combined
+
+    if not key:
+        raise ValueError('key must be given to join partial selects.')
+    if type(key) == str:
+        key = [key]
+    n_key = len(key)
+    order = list()
+    values = dict()
+    seen = dict()
+    for n, (part, rows) in enumerate(zip(parts, results)):
+        names = part.s.components
+        for row in rows:
+            row_key = tuple(row[:n_key])
+            if row_key not in values:
+                order.append(row_key)
+                values[row_key] = dict(zip(key, row_key))
+                seen[row_key] = set()
+            values[row_key].update(zip(names[n_key:], row[n_key:]))
+            seen[row_key].add(n)
+
+    # inner join: keep only keys present in every part
+    return [tuple(values[k][c] for c in query.s.components)
+            for k in order if len(seen[k]) == len(parts)]
+
+
+def fuse_queries(queries, tag='query_tag'):
+    """
+    fuse queries with the same SELECT list arity into a single UNION ALL
+    statement; each branch leads with a tag column holding the index of
+    its query so split_fused can hand the rows back out
+    """
+    queries = list(queries)
+    if not queries:
+        raise ValueError('At least one query must be given.')
+    arity = len(queries[0].s.components)
+    tag_pattern = re.compile('(^|[\\s.]){0}$'.format(re.escape(tag)),
+                             flags=re.I)
+    branches = list()
+    for n, q in enumerate(queries):
+        if len(q.s.components) != arity:
+            raise ValueError(
+                'All queries must select the same number of columns.'
+            )
+        if any(tag_pattern.search(c) for c in q.s.components):
+            raise ValueError(
+                "tag '{0}' is already selected by a query.".format(tag)
+            )
+        branch = copy.deepcopy(q)
+        branch.s.components.insert(0, '{0} AS {1}'.format(n, tag))
+        branches.append(branch.statement)
+    return ' UNION ALL '.join(branches)
+
+
+def split_fused(queries, rows):
+    """
+    split rows fetched for fuse_queries(queries) into one list of rows per
+    query, dropping the leading tag column
+    """
+    out = [list() for q in queries]
+    for row in rows:
+        out[int(row[0])].append(tuple(row[1:]))
+    return out
+
+
+def fetch_columns(cursor, query, size=1000, use_numpy=False):
+    """
+    stream the rows of an executed cursor with fetchmany into one compact
+    buffer per column of query's SELECT list: integer arrays for integers,
+    array('d') for floats (NumPy arrays if use_numpy and NumPy is
+    installed) and plain lists for anything else
+    """
+    names = list(query.s.components)
+    if len(set(names)) != len(names):
+        raise ValueError('Query selects the same column more than once.')
+    description = getattr(cursor, 'description', None)
+    if description is not None and len(description) != len(names):
+        raise ValueError(
+            'Cursor returns {0} columns but query selects {1}.'.format(
+                len(description), len(names)
+            )
+        )
+
+    columns = [None] * len(names)
+    rows = cursor.fetchmany(size)
+    while rows:
+        for n in range(len(names)):
+            columns[n] = _extend_column(columns[n], [r[n] for r in rows])
+        rows = cursor.fetchmany(size)
+
+    out = OrderedDict()
+    for name, column in zip(names, columns):
+        if column is None:
+            column = list()
+        elif use_numpy and np is not None and isinstance(column, array):
+            column = np.frombuffer(column, dtype=column.typecode)
+        out[name] = column
+    return out
+
+
+def _extend_column(column, values):
+    """
+    append values to a column buffer, widening an integer array to
+    array('d') when floats arrive and its integers are exact as doubles,
+    and falling back to a list (keeping integers exact) otherwise
+    """
+    if column is None:
+        if all(type(v) in _int_types for v in values):
+            column = array(_int_typecode)
+        elif all(type(v) in _int_types + (float,) for v in values):
+            column = array('d')
+        else:
+            column = list()
+    if isinstance(column, list):
+        column.extend(values)
+        return column
+    try:
+        column.extend(array(column.typecode, values))
+    except TypeError:
+        # doubles hold integers exactly only up to 2**53
+        if column.typecode == _int_typecode and \
+                all(type(v) in _int_types + (float,) for v in values) and \
+                all(-2 ** 53 <= v <= 2 ** 53 for v in column):
+            return _extend_column(array('d', column), values)
+        column = list(column)
+        column.extend(values)
+    except OverflowError:
+        column = list(column)
+        column.extend(values)
+    return column
+
+
+def _disjuncts(where):
+    """
+    group the indexes of the components of a WhereComponent into its
+    OR-separated terms; AND binds tighter than OR, so each group is one
+    term of the OR-chain
+    """
+    groups = list()
+    for n, c in enumerate(where.components):
+        if c.startswith('OR ') or not groups:
+            groups.append([n])
+        else:
+            groups[-1].append(n)
+    return groups
+
+
+def _pack(items, build, fits):
+    """
+    greedily pack consecutive items into as few chunks as build into parts
+    that fit; returns None if a single item does not fit on its own
+    """
+    chunks = list()
+    chunk = list()
+    for item in items:
+        candidate = build(chunk + item)
+        if fits(candidate):
+            chunk = chunk + item
+            continue
+        if not chunk:
+            return None
+        chunks.append(chunk)
+        chunk = list(item)
+        if not fits(build(chunk)):
+            return None
+    if chunk:
+        chunks.append(chunk)
+    return chunks
@@ -0,0 +1,156 @@
+"""
+Differential fuzz test pinning the rendered SQL of Query.statement and
+Query.__str__: random operation sequences are replayed on both querpy and
+frozen_querpy, a frozen copy of the original regex-based implementation
+
+>>> python -m unittest test.fuzz_test
+>>> python -m test.fuzz_test --timing [n_cases]  # speed ratio per case
+"""
+
+import random
+import sys
+import timeit
+import unittest as ut
+import querpy
+from . import frozen_querpy
+
+
+N_CASES = 500
+SEED = 20150319
+
+COLUMNS = ['col1', 'col2', 'tbl.id', 'nt.city', 'FundAUM', 'ORDERS',
+           'col3 [c3]', 'COUNT(*)', 'SUM(val) AS total']
+TABLES = ['tbl1 t1', 'ex_db.dbo.ex_table tbl', 'dbo.a_table']
+JOIN_TYPES = ['', 'left', 'RIGHT', 'inner', 'outer']
+CONDITIONS = ['col1 = 1', 'col2 IS NULL', 'tbl.id = nt.id',
+              'col4 BETWEEN col1 AND col2', 'col3 BETWEEN 0 AND 10',
+              "FundType = 'Bond'", 'ORDERS > 5', 'col1 IN (1, 2)']
+
+
+def pick(rng, items):
+    if rng.random() < 0.3:
+        return rng.sample(items, rng.randint(1, 3))
+    return rng.choice(items)
+
+
+def random_ops(rng, n_ops=None):
+    """
+    generate a random sequence of (operation, argument) pairs; arguments
+    are fixed up front so the sequence replays identically on any Query
+    """
+    if n_ops is None:
+        n_ops = rng.randint(0, 25)
+    ops = list()
+    for _ in range(n_ops):
+        op = rng.randint(0, 11)
+        if op == 0:
+            ops.append(('s +=', pick(rng, COLUMNS)))
+        elif op == 1:
+            ops.append(('f +=', rng.choice(TABLES)))
+        elif op == 2:
+            ops.append(('join_type', rng.choice(JOIN_TYPES)))
+        elif op == 3:
+            ops.append(('j +=', frozen_querpy.build_join(
+                rng.choice(TABLES), 't1.id', 'tbl.id',
+                *rng.choice([[], ['t1.city', 'nt.city']])
+            )))
+        elif op == 4:
+            ops.append(('w +=', pick(rng, CONDITIONS)))
+        elif op == 5:
+            ops.append(('w &=', pick(rng, CONDITIONS)))
+        elif op == 6:
+            ops.append(('w |=', pick(rng, CONDITIONS)))
+        elif op == 7:
+            ops.append(('g +=', pick(rng, COLUMNS[:5])))
+        elif op == 8:
+            ops.append(('distinct', None))
+        elif op == 9:
+            ops.append(('top', rng.choice([False, 5, 100])))
+        elif op == 10:
+            ops.append(('setitem', (rng.choice('swg'), rng.random(),
+                                    rng.choice(COLUMNS + CONDITIONS))))
+        else:
+            ops.append(('clear', rng.choice('sfjwg')))
+    return ops
+
+
+def apply_ops(module, ops):
+    """
+    build a module.Query by replaying ops
+    """
+    query = module.Query()
+    for op, arg in ops:
+        if op == 's +=':
+            query.s += arg
+        elif op == 'f +=':
+            query.f += arg
+        elif op == 'join_type':
+            query.join_type = arg
+        elif op == 'j +=':
+            query.j += arg
+        elif op == 'w +=':
+            query.w += arg
+        elif op == 'w &=':
+            query.w &= arg
+        elif op == 'w |=':
+            query.w |= arg
+        elif op == 'g +=':
+            query.g += arg
+        elif op == 'distinct':
+            query.distinct = not query.distinct
+        elif op == 'top':
+            query.top = arg
+        elif op == 'setitem':
+            name, fraction, value = arg
+            comp = getattr(query, name)
+            if comp.components:
+                comp[int(fraction * len(comp.components))] = value
+        else:
+            getattr(query, arg).clear()
+    return query
+
+
+class TestRenderingMatchesFrozen(ut.TestCase):
+
+    def check(self, ops, case):
+        query = apply_ops(querpy, ops)
+        frozen = apply_ops(frozen_querpy, ops)
+        self.assertEqual(query.statement, frozen.statement,
+                         'statement differs in case {0}'.format(case))
+        self.assertEqual(str(query), str(frozen),
+                         '__str__ differs in case {0}'.format(case))
+
+    def test_random_queries(self):
+        rng = random.Random(SEED)
+        for case in range(N_CASES):
+            self.check(random_ops(rng), case)
+
+    def test_empty_query(self):
+        self.check([], 'empty')
+
+
+def timing(n_cases, number=200):
+    """
+    print the frozen/current speed ratio of rendering each generated case
+    """
+    rng = random.Random(SEED)
+    ratios = list()
+    for case in range(n_cases):
+        ops = random_ops(rng)
+        query = apply_ops(querpy, ops)
+        frozen = apply_ops(frozen_querpy, ops)
+        old = timeit.timeit(lambda: str(frozen), number=number)
+        new = timeit.timeit(lambda: str(query), number=number)
+        ratios.append(old / new)
+        print('case {0:>4}: {1:>6.2f}x  {2}'.format(
+            case, ratios[-1], query.statement[:60]
+        ))
+    print('mean ratio: {0:.2f}x'.format(sum(ratios) / len(ratios)))
+
+
+if __name__ == '__main__':
+    if '--timing' in sys.argv:
+        args = [a for a in sys.argv[1:] if a != '--timing']
+        timing(int(args[0]) if args else 50)
+    else:
+        ut.main()
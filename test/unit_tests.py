@@ -1,5 +1,11 @@
 import unittest as ut
 from querpy import *
+from querpy import _extend_column, _int_typecode
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
 
 
 class TestQueryComponent(ut.TestCase):
@@ -365,6 +371,439 @@ class TestJoinFunction(ut.TestCase):
         self.assertRaises(BaseException, build_join, invalid)
 
 
+class TestSplitQuery(ut.TestCase):
+
+    def setUp(self):
+        self.query = Query()
+        self.query.s += ['id', 'col1', 'col2', 'col3']
+        self.query.f += 'tbl'
+        self.query.w += 'col1 = ?'
+        self.query.w |= ['col2 = ?', 'col3 = ?']
+        self.query.w &= 'col1 > ?'
+
+    def test_no_limit_raises_ValueError(self):
+        self.assertRaises(ValueError, split_query, self.query)
+
+    def test_query_within_limit_not_split(self):
+        parts = split_query(self.query, max_params=4)
+        self.assertEqual(len(parts), 1)
+        self.assertEqual(parts[0].statement, self.query.statement)
+        self.assertFalse(parts[0] is self.query)
+
+    def test_split_or_chain(self):
+        parts = split_query(self.query, max_params=2, key='id')
+        self.assertEqual(
+            [p.statement for p in parts],
+            ['SELECT id, col1, col2, col3 FROM tbl WHERE col1 = ? OR col2 = ?',
+             'SELECT id, col1, col2, col3 FROM tbl WHERE col3 = ? AND col1 > ?']
+        )
+        # original query is left untouched
+        self.assertEqual(len(self.query.w.components), 4)
+
+    def test_split_or_chain_distinct(self):
+        self.query.distinct = True
+        parts = split_query(self.query, max_params=2)
+        self.assertEqual(len(parts), 2)
+
+    def test_split_or_chain_requires_unique_rows(self):
+        # without DISTINCT or a selected key, unioning would drop rows
+        self.assertRaises(ValueError, split_query, self.query, max_params=2)
+        self.assertRaises(ValueError, split_query, self.query, max_params=2,
+                          key='other_id')
+
+    def test_split_aggregate_without_group_by_raises_ValueError(self):
+        self.query.s.clear()
+        self.query.s += 'COUNT(*)'
+        self.query.distinct = True
+        self.assertRaises(ValueError, split_query, self.query, max_params=2)
+
+    def test_split_returns_params_per_part(self):
+        self.query.s[1] = 'col1 + ? AS col1'
+        pairs = split_query(self.query, max_params=3, key='id',
+                            params=[10, 1, 2, 3, 0])
+        self.assertEqual([p for _, p in pairs], [(10, 1, 2), (10, 3, 0)])
+        self.assertRaises(ValueError, split_query, self.query, max_params=3,
+                          key='id', params=[1, 2])
+
+    def test_split_select_list_returns_params_per_part(self):
+        self.query.w.clear()
+        self.query.s.clear()
+        self.query.s += ['col1 + ? AS c1', 'id', 'col2 + ? AS c2']
+        pairs = split_query(self.query, max_params=1, key='id',
+                            params=['a', 'b'])
+        self.assertEqual(
+            [(p.statement, v) for p, v in pairs],
+            [('SELECT id, col1 + ? AS c1 FROM tbl', ('a',)),
+             ('SELECT id, col2 + ? AS c2 FROM tbl', ('b',))]
+        )
+
+    def test_split_max_bytes(self):
+        limit = len(self.query.statement) - 1
+        parts = split_query(self.query, max_bytes=limit, key='id')
+        self.assertEqual(len(parts), 2)
+        for p in parts:
+            self.assertTrue(len(p.statement) <= limit)
+
+    def test_split_select_list_on_key(self):
+        self.query.w.clear()
+        limit = len('SELECT id, col1, col2 FROM tbl')
+        parts = split_query(self.query, max_bytes=limit, key='id')
+        self.assertEqual(
+            [p.statement for p in parts],
+            ['SELECT id, col1, col2 FROM tbl', 'SELECT id, col3 FROM tbl']
+        )
+
+    def test_unsplittable_raises_ValueError(self):
+        self.assertRaises(ValueError, split_query, self.query, max_params=1,
+                          key='id')
+        self.query.top = 5
+        self.assertRaises(ValueError, split_query, self.query, max_params=2,
+                          key='id')
+
+    def test_combine_unsplit_keeps_duplicate_rows(self):
+        import sqlite3
+        conn = sqlite3.connect(':memory:')
+        conn.execute('CREATE TABLE t (id, a, b)')
+        conn.executemany('INSERT INTO t VALUES (?, ?, ?)',
+                         [(1, 1, 1), (2, 1, 1), (3, 2, 2)])
+        query = Query()
+        query.s += ['a', 'b']
+        query.f += 't'
+        parts = split_query(query, max_bytes=1000)
+        results = [conn.execute(p.statement).fetchall() for p in parts]
+        self.assertEqual(combine_results(query, parts, results),
+                         [(1, 1), (1, 1), (2, 2)])
+
+    def test_combine_union(self):
+        parts = split_query(self.query, max_params=2, key='id')
+        results = [[(1, 'a', 'b', 'c'), (2, 'd', 'e', 'f')],
+                   [(2, 'd', 'e', 'f'), (3, 'g', 'h', 'i')]]
+        self.assertEqual(
+            combine_results(self.query, parts, results),
+            [(1, 'a', 'b', 'c'), (2, 'd', 'e', 'f'), (3, 'g', 'h', 'i')]
+        )
+
+    def test_combine_join_on_key(self):
+        self.query.w.clear()
+        self.query.s.clear()
+        self.query.s += ['col1', 'id', 'col2', 'col3']
+        limit = len('SELECT id, col1, col2 FROM tbl')
+        parts = split_query(self.query, max_bytes=limit, key='id')
+        results = [[(1, 'a', 'b'), (2, 'd', 'e')], [(2, 'f'), (1, 'c')]]
+        self.assertEqual(
+            combine_results(self.query, parts, results, key='id'),
+            [('a', 1, 'b', 'c'), ('d', 2, 'e', 'f')]
+        )
+        self.assertRaises(ValueError, combine_results, self.query, parts,
+                          results)
+
+    def test_combine_join_counts_parts_not_rows(self):
+        self.query.w.clear()
+        limit = len('SELECT id, col1, col2 FROM tbl')
+        parts = split_query(self.query, max_bytes=limit, key='id')
+        # key 2 appears twice in the first part but not in the second
+        results = [[(1, 'a', 'b'), (2, 'd', 'e'), (2, 'd', 'e')], [(1, 'c')]]
+        self.assertEqual(
+            combine_results(self.query, parts, results, key='id'),
+            [(1, 'a', 'b', 'c')]
+        )
+
+    def test_combine_against_sqlite(self):
+        import sqlite3
+        conn = sqlite3.connect(':memory:')
+        conn.execute('CREATE TABLE tbl (id, col1, col2, col3)')
+        conn.executemany('INSERT INTO tbl VALUES (?, ?, ?, ?)',
+                         [(i, i % 3, i % 5, i % 7) for i in range(50)])
+        params = [1, 2, 3, 0]
+        expected = conn.execute(self.query.statement, params).fetchall()
+        pairs = split_query(self.query, max_params=2, key='id',
+                            params=params)
+        results = [conn.execute(p.statement, v).fetchall() for p, v in pairs]
+        self.assertEqual(sorted(combine_results(self.query, pairs, results)),
+                         sorted(expected))
+
+
+class TestFuseQueries(ut.TestCase):
+
+    def setUp(self):
+        self.queries = list()
+        for cond in ['col1 = 1', 'col1 = 2', 'col2 > 3']:
+            q = Query()
+            q.s += ['id', 'col1']
+            q.f += 'tbl'
+            q.w += cond
+            self.queries.append(q)
+
+    def test_fuse_statement(self):
+        self.assertEqual(
+            fuse_queries(self.queries[:2]),
+            'SELECT 0 AS query_tag, id, col1 FROM tbl WHERE col1 = 1 '
+            'UNION ALL '
+            'SELECT 1 AS query_tag, id, col1 FROM tbl WHERE col1 = 2'
+        )
+        # source queries are left untouched
+        self.assertEqual(self.queries[0].s.components, ['id', 'col1'])
+
+    def test_fuse_mismatched_arity_raises_ValueError(self):
+        self.queries[1].s += 'col2'
+        self.assertRaises(ValueError, fuse_queries, self.queries)
+        self.assertRaises(ValueError, fuse_queries, [])
+
+    def test_fuse_tag_in_use_raises_ValueError(self):
+        self.queries[1].s[1] = 'col1 AS Query_Tag'
+        self.assertRaises(ValueError, fuse_queries, self.queries)
+        self.assertRaises(ValueError, fuse_queries, self.queries, tag='col1')
+        self.assertTrue(fuse_queries(self.queries, tag='src'))
+
+    def test_split_fused_numeric_tag(self):
+        from decimal import Decimal
+        rows = [(Decimal(1), 'b'), (Decimal(0), 'a')]
+        self.assertEqual(split_fused(self.queries[:2], rows),
+                         [[('a',)], [('b',)]])
+
+    def test_fuse_and_split_against_sqlite(self):
+        import sqlite3
+        conn = sqlite3.connect(':memory:')
+        conn.execute('CREATE TABLE tbl (id, col1, col2)')
+        conn.executemany('INSERT INTO tbl VALUES (?, ?, ?)',
+                         [(i, i % 3, i % 5) for i in range(30)])
+        expected = [sorted(conn.execute(q.statement).fetchall())
+                    for q in self.queries]
+        rows = conn.execute(fuse_queries(self.queries)).fetchall()
+        split = split_fused(self.queries, rows)
+        self.assertEqual([sorted(r) for r in split], expected)
+
+
+class TestFetchColumns(ut.TestCase):
+
+    def setUp(self):
+        import sqlite3
+        self.conn = sqlite3.connect(':memory:')
+        self.conn.execute('CREATE TABLE tbl (id, val, name)')
+        self.conn.executemany('INSERT INTO tbl VALUES (?, ?, ?)',
+                              [(i, i / 2.0, 'n' + str(i)) for i in range(7)])
+        self.query = Query()
+        self.query.s += ['id', 'val', 'name']
+        self.query.f += 'tbl'
+
+    def test_fetch_columns(self):
+        cursor = self.conn.execute(self.query.statement)
+        columns = fetch_columns(cursor, self.query, size=3)
+        self.assertEqual(list(columns.keys()), ['id', 'val', 'name'])
+        self.assertEqual(columns['id'].typecode, _int_typecode)
+        self.assertEqual(columns['val'].typecode, 'd')
+        self.assertEqual(list(columns['id']), list(range(7)))
+        self.assertEqual(list(columns['val']), [i / 2.0 for i in range(7)])
+        self.assertEqual(columns['name'], ['n' + str(i) for i in range(7)])
+
+    def test_fetch_columns_widens_and_falls_back(self):
+        self.conn.execute("INSERT INTO tbl VALUES (7.5, NULL, 'n7')")
+        self.query.s.clear()
+        self.query.s += ['id', 'val']
+        self.query.f.clear()
+        self.query.f += 'tbl ORDER BY rowid'
+        cursor = self.conn.execute(self.query.statement)
+        columns = fetch_columns(cursor, self.query, size=3)
+        self.assertEqual(columns['id'].typecode, 'd')
+        self.assertEqual(list(columns['id']), list(range(7)) + [7.5])
+        self.assertEqual(columns['val'][-1], None)
+
+    def test_fetch_columns_int_with_null_later_stays_exact(self):
+        self.conn.execute("INSERT INTO tbl VALUES (NULL, 0.5, 'n7')")
+        self.conn.execute("INSERT INTO tbl VALUES (?, 0.5, 'n8')",
+                          (2 ** 60 + 1,))
+        self.query.f.clear()
+        self.query.f += 'tbl ORDER BY rowid'
+        cursor = self.conn.execute(self.query.statement)
+        columns = fetch_columns(cursor, self.query, size=3)
+        self.assertEqual(columns['id'], list(range(7)) + [None, 2 ** 60 + 1])
+        self.assertEqual([type(v) for v in columns['id'][:7]], [int] * 7)
+
+    def test_fetch_columns_int_overflow_stays_exact(self):
+        values = [[1], [2], [2 ** 64]]
+        column = None
+        for v in values:
+            column = _extend_column(column, v)
+        self.assertEqual(column, [1, 2, 2 ** 64])
+
+    def test_fetch_columns_large_int_then_float_stays_exact(self):
+        column = _extend_column(_extend_column(None, [2 ** 60 + 1]), [0.5])
+        self.assertEqual(column, [2 ** 60 + 1, 0.5])
+        column = _extend_column(_extend_column(None, [2 ** 53]), [0.5])
+        self.assertEqual(column.typecode, 'd')
+
+    def test_fetch_columns_numpy_stand_in(self):
+        import querpy
+
+        class StandIn(object):
+            # records frombuffer calls in place of NumPy
+            def frombuffer(self, buffer, dtype):
+                return ('ndarray', dtype, list(buffer))
+
+        saved = querpy.np
+        querpy.np = StandIn()
+        try:
+            cursor = self.conn.execute(self.query.statement)
+            columns = fetch_columns(cursor, self.query, use_numpy=True)
+        finally:
+            querpy.np = saved
+        self.assertEqual(columns['id'],
+                         ('ndarray', _int_typecode, list(range(7))))
+        self.assertEqual(columns['val'],
+                         ('ndarray', 'd', [i / 2.0 for i in range(7)]))
+        self.assertEqual(columns['name'], ['n' + str(i) for i in range(7)])
+
+    def test_fetch_columns_duplicate_names_raises_ValueError(self):
+        self.query.s += 'id'
+        cursor = self.conn.execute(self.query.statement)
+        self.assertRaises(ValueError, fetch_columns, cursor, self.query)
+
+    def test_fetch_columns_empty(self):
+        self.query.w += 'id < 0'
+        cursor = self.conn.execute(self.query.statement)
+        columns = fetch_columns(cursor, self.query)
+        self.assertEqual(list(columns.values()), [[], [], []])
+
+    def test_fetch_columns_mismatch_raises_ValueError(self):
+        cursor = self.conn.execute('SELECT id FROM tbl')
+        self.assertRaises(ValueError, fetch_columns, cursor, self.query)
+
+    @ut.skipIf(np is None, 'NumPy is not installed')
+    def test_fetch_columns_numpy(self):
+        cursor = self.conn.execute(self.query.statement)
+        columns = fetch_columns(cursor, self.query, use_numpy=True)
+        self.assertEqual(columns['id'].dtype, np.dtype(_int_typecode))
+        self.assertEqual(columns['val'].sum(), sum(i / 2.0 for i in range(7)))
+
+
+class CountingCursor(object):
+
+    def __init__(self):
+        self.executed = list()
+        self.closed = False
+
+    def execute(self, statement, params=()):
+        self.executed.append((statement, params))
+
+    def close(self):
+        self.closed = True
+
+
+class CountingConnection(object):
+    # stand-in driver whose cursor() counts as one statement prepare
+
+    def __init__(self):
+        self.prepares = 0
+
+    def cursor(self):
+        self.prepares += 1
+        return CountingCursor()
+
+
+class TestStatementCache(ut.TestCase):
+
+    def setUp(self):
+        self.conn = CountingConnection()
+        self.cache = StatementCache(self.conn, size=2)
+        self.queries = list()
+        for tbl in ['tbl1', 'tbl2', 'tbl3']:
+            q = Query()
+            q.s += 'col1'
+            q.f += tbl
+            q.w += 'col1 = ?'
+            self.queries.append(q)
+
+    def test_invalid_size_raises_ValueError(self):
+        self.assertRaises(ValueError, StatementCache, self.conn, 0)
+
+    def test_hit_reuses_prepared_handle(self):
+        first = self.cache.execute(self.queries[0], (1,))
+        second = self.cache.execute(self.queries[0], (2,))
+        self.assertTrue(first is second)
+        self.assertEqual(self.conn.prepares, 1)
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 1))
+        self.assertEqual(
+            first.executed,
+            [('SELECT col1 FROM tbl1 WHERE col1 = ?', (1,)),
+             ('SELECT col1 FROM tbl1 WHERE col1 = ?', (2,))]
+        )
+
+    def test_statement_string_shares_key_with_query(self):
+        self.cache.execute(self.queries[0])
+        self.cache.execute(self.queries[0].statement)
+        self.assertEqual(self.conn.prepares, 1)
+
+    def test_lru_eviction(self):
+        evicted = self.cache.execute(self.queries[0])
+        self.cache.execute(self.queries[1])
+        self.cache.execute(self.queries[0])  # tbl2 is now least recent
+        self.cache.execute(self.queries[2])
+        self.assertEqual(self.cache.evictions, 1)
+        self.assertEqual(len(self.cache), 2)
+        self.cache.execute(self.queries[1])
+        self.assertEqual(self.conn.prepares, 4)
+        self.assertEqual(str(self.cache),
+                         'size: 2/2, hits: 1, misses: 4, evictions: 2')
+        # the caller may still fetch from an evicted handle
+        self.assertFalse(evicted.closed)
+
+    def test_clear_closes_evicted_handles(self):
+        evicted = self.cache.execute(self.queries[0])
+        self.cache.execute(self.queries[1])
+        self.cache.execute(self.queries[2])
+        self.assertEqual(self.cache.evicted, [evicted])
+        self.assertFalse(evicted.closed)
+        self.cache.clear()
+        self.assertTrue(evicted.closed)
+        self.assertEqual(self.cache.evicted, [])
+
+    def test_on_evict_callback(self):
+        evicted = list()
+        cache = StatementCache(self.conn, size=1, on_evict=evicted.append)
+        first = cache.execute(self.queries[0])
+        cache.execute(self.queries[1])
+        self.assertEqual(evicted, [first])
+        self.assertEqual(cache.evicted, [])
+        self.assertFalse(first.closed)
+
+    def test_evicted_handle_stays_usable_with_sqlite(self):
+        import sqlite3
+        conn = sqlite3.connect(':memory:')
+        conn.execute('CREATE TABLE tbl1 (col1)')
+        conn.execute('INSERT INTO tbl1 VALUES (1)')
+        cache = StatementCache(conn, size=1)
+        first = cache.execute(self.queries[0], (1,))
+        cache.execute('SELECT 2')
+        self.assertEqual(cache.evictions, 1)
+        self.assertEqual(first.fetchall(), [(1,)])
+
+    def test_failed_prepare_not_counted_as_miss(self):
+        def prepare(conn, statement):
+            raise RuntimeError('prepare failed')
+
+        cache = StatementCache(self.conn, prepare=prepare)
+        self.assertRaises(RuntimeError, cache.execute, self.queries[0])
+        self.assertEqual((cache.hits, cache.misses, len(cache)), (0, 0, 0))
+
+    def test_clear_closes_handles(self):
+        handle = self.cache.execute(self.queries[0])
+        self.cache.clear()
+        self.assertTrue(handle.closed)
+        self.assertEqual(len(self.cache), 0)
+
+    def test_custom_prepare(self):
+        prepared = list()
+
+        def prepare(conn, statement):
+            prepared.append(statement)
+            return conn.cursor()
+
+        cache = StatementCache(self.conn, prepare=prepare)
+        cache.execute(self.queries[0])
+        cache.execute(self.queries[0])
+        self.assertEqual(prepared, [self.queries[0].statement])
+
+
 if __name__ == '__main__':
 
     ut.main()
\ No newline at end of file